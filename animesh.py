@@ -2,6 +2,7 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 import threading
 import requests
+from requests.adapters import HTTPAdapter
 import platform
 import subprocess
 import os
@@ -15,10 +16,14 @@ import time
 # Server configuration
 SERVER_URL = "https://deadball.onrender.com"  # Replace with your server URL
 PING_INTERVAL = 30
+HTTP_POOL_SIZE = 2  # keep-alive connections per thread; each polling thread has its own session
+AUTHORIZED_BSSID_TTL = 60  # seconds to reuse the server's authorized BSSID list
+BSSID_PATTERN = re.compile(r"^([0-9a-f]{2}[:]){5}([0-9a-f]{2})$")  # shared by the Windows and Linux parsers
 
 class StudentClient:
     def __init__(self):
         self.username = None
+        self.http_local = threading.local()
         self.device_id = self.get_device_id()
         self.current_wifi = None
         self.current_bssid = None
@@ -28,6 +33,8 @@ class StudentClient:
         self.last_wifi_status = None
         self.timetable = {}
         self.attendance_session_active = False
+        self.authorized_bssids = None
+        self.authorized_bssids_fetched_at = 0
         self.setup_wifi_checker()
         self.root = tk.Tk()
         self.setup_login_ui()
@@ -35,6 +42,22 @@ class StudentClient:
         self.hide_console()
         self.root.mainloop()
 
+    @property
+    def http(self):
+        """This thread's HTTP session, created on first use so no pool is shared across threads"""
+        session = getattr(self.http_local, "session", None)
+        if session is None:
+            session = self.http_local.session = self.create_http_session()
+        return session
+
+    def create_http_session(self):
+        """Reuse pooled keep-alive connections instead of a new TLS handshake per request"""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
     def get_device_id(self):
         """Generate a unique device ID for this student"""
         if os.name == 'nt':
@@ -90,8 +113,8 @@ class StudentClient:
             )
             for line in result.stdout.splitlines():
                 if "BSSID" in line:
-                    bssid = line.split(":")[1].strip().lower()
-                    if re.match(r"^([0-9a-f]{2}[:]){5}([0-9a-f]{2})$", bssid):
+                    bssid = line.split(":", 1)[1].strip().lower()
+                    if BSSID_PATTERN.match(bssid):
                         self.current_bssid = bssid
                         return bssid
             return None
@@ -116,7 +139,7 @@ class StudentClient:
                 capture_output=True, text=True
             )
             bssid = result.stdout.strip().lower()
-            if re.match(r"^([0-9a-f]{2}[:]){5}([0-9a-f]{2})$", bssid):
+            if BSSID_PATTERN.match(bssid):
                 self.current_bssid = bssid
                 return bssid
             return None
@@ -129,14 +152,8 @@ class StudentClient:
             return True
         
         try:
-            # Get authorized BSSIDs from server
-            response = requests.get(
-                f"{SERVER_URL}/get_authorized_bssids",
-                timeout=5
-            )
-            
-            if response.status_code == 200:
-                authorized_bssids = response.json().get('bssids', [])
+            authorized_bssids = self.get_authorized_bssids()
+            if authorized_bssids is not None:
                 current_bssid = self.get_bssid()
                 return current_bssid in authorized_bssids
         except:
@@ -144,6 +161,21 @@ class StudentClient:
         
         return False
 
+    def get_authorized_bssids(self):
+        """Return the authorized BSSIDs, refreshing from the server at most once per TTL"""
+        now = time.monotonic()
+        if self.authorized_bssids is None or now - self.authorized_bssids_fetched_at > AUTHORIZED_BSSID_TTL:
+            response = self.http.get(
+                f"{SERVER_URL}/get_authorized_bssids",
+                timeout=5
+            )
+            
+            if response.status_code != 200:
+                return None
+            self.authorized_bssids = set(response.json().get('bssids', []))
+            self.authorized_bssids_fetched_at = now
+        return self.authorized_bssids
+
     def setup_login_ui(self):
         self.root.title("Student Portal")
         self.root.geometry("350x250")
@@ -185,7 +217,7 @@ class StudentClient:
             return
             
         try:
-            response = requests.post(
+            response = self.http.post(
                 f"{SERVER_URL}/login",
                 json={"username": username, "password": password},
                 timeout=5
@@ -213,7 +245,7 @@ class StudentClient:
                         wifi_status = "connected" if self.check_wifi() else "disconnected"
                         
                         # Send attendance ping
-                        requests.post(
+                        self.http.post(
                             f"{SERVER_URL}/ping",
                             json={
                                 "username": self.username,
@@ -226,7 +258,7 @@ class StudentClient:
                         
                         # Send WiFi status if changed
                         if wifi_status != self.last_wifi_status:
-                            requests.post(
+                            self.http.post(
                                 f"{SERVER_URL}/update_wifi_status",
                                 json={
                                     "username": self.username,
@@ -478,7 +510,7 @@ class StudentClient:
     def update_timetable(self):
         while True:
             try:
-                response = requests.get(f"{SERVER_URL}/timetable", timeout=5)
+                response = self.http.get(f"{SERVER_URL}/timetable", timeout=5)
                 if response.status_code == 200:
                     self.timetable = response.json()
                     self.main_window.after(0, self.display_timetable)
@@ -531,7 +563,7 @@ class StudentClient:
     def update_attendance_data(self):
         while True:
             try:
-                response = requests.get(
+                response = self.http.get(
                     f"{SERVER_URL}/student_attendance/{self.username}",
                     timeout=5
                 )
@@ -558,13 +590,17 @@ class StudentClient:
         """Check if there's an active attendance session"""
         while True:
             try:
-                response = requests.get(
+                response = self.http.get(
                     f"{SERVER_URL}/get_attendance_session",
                     timeout=5
                 )
                 if response.status_code == 200:
                     data = response.json()
-                    self.attendance_session_active = data.get('active', False)
+                    active = data.get('active', False)
+                    if active != self.attendance_session_active:
+                        # Sessions change the authorized BSSIDs; refetch on next check
+                        self.authorized_bssids = None
+                    self.attendance_session_active = active
                     
                     if self.attendance_session_active:
                         self.main_window.after(0, self.timer_label.config, 
@@ -595,7 +631,7 @@ class StudentClient:
         
         try:
             # Send initial attendance mark
-            requests.post(
+            self.http.post(
                 f"{SERVER_URL}/update_attendance",
                 json={
                     "student_id": self.username,
@@ -623,7 +659,7 @@ class StudentClient:
                 self.timer_label.config(text="WiFi disconnected! Timer paused.", fg="red")
                 try:
                     # Update status to left if disconnected
-                    requests.post(
+                    self.http.post(
                         f"{SERVER_URL}/update_attendance",
                         json={
                             "student_id": self.username,
@@ -653,7 +689,7 @@ class StudentClient:
         last_ring = ""
         while True:
             try:
-                response = requests.get(
+                response = self.http.get(
                     f"{SERVER_URL}/get_random_rings",
                     params={"student_id": self.username},
                     timeout=5
@@ -707,7 +743,7 @@ class StudentClient:
             # Send update if status changed
             if current_status != self.last_wifi_status:
                 try:
-                    requests.post(
+                    self.http.post(
                         f"{SERVER_URL}/update_wifi_status",
                         json={
                             "username": self.username,
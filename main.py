@@ -1,23 +1,211 @@
-from flask import Flask, request, jsonify
+import os
+
+# Opt-in cooperative I/O for `python main.py`; must patch before anything imports threading.
+# Under gunicorn's gevent worker (render.yaml) the worker does this itself.
+USE_GEVENT = bool(os.getenv('USE_GEVENT'))
+if USE_GEVENT:
+    from gevent import monkey
+    monkey.patch_all()
+
+from flask import Flask, request, jsonify, g
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from datetime import datetime, timedelta
 import threading
 import time
 import random
+import heapq
+import itertools
+import sched
+import hashlib
 from werkzeug.security import generate_password_hash, check_password_hash
-import uuid
+import secrets
 import logging
 from logging.handlers import RotatingFileHandler
-import os
 import signal
 import atexit
 import json
 from functools import wraps
-from collections import defaultdict
+from collections import defaultdict, OrderedDict, Counter
+
+try:
+    import orjson
+except ImportError:  # fall back to Flask's stdlib json provider
+    orjson = None
+
+try:
+    from argon2 import PasswordHasher
+    from argon2.exceptions import VerificationError, InvalidHashError
+    password_hasher = PasswordHasher()
+except ImportError:  # fall back to Werkzeug's PBKDF2
+    password_hasher = None
+
+try:
+    from gevent import monkey as gevent_monkey, get_hub
+except ImportError:
+    gevent_monkey = None
+
+def run_off_hub(fn, *args):
+    """Run CPU-bound work in gevent's native threadpool when monkey-patched, else inline"""
+    if gevent_monkey is not None and gevent_monkey.is_module_patched('threading'):
+        return get_hub().threadpool.apply(fn, args)
+    return fn(*args)
+
+def hash_password(password):
+    """Hash a password without stalling other greenlets"""
+    return run_off_hub(_hash_password, password)
+
+def _hash_password(password):
+    """Hash with argon2 (C, releases the GIL) when available, else Werkzeug PBKDF2"""
+    if password_hasher is not None:
+        return password_hasher.hash(password)
+    return generate_password_hash(password)
+
+def verify_password(stored_hash, password):
+    """Verify a password; a recent failure for the same hash and password is answered without hashing"""
+    key = (stored_hash, hashlib.sha256(password.encode()).digest())
+    now = time.monotonic()
+    with verify_cache_lock:
+        expiry = verify_cache.get(key)
+        if expiry is not None and expiry > now:
+            verify_cache.move_to_end(key)
+            return False
+    
+    verified = run_off_hub(_check_password, stored_hash, password)
+    if not verified:
+        # Only failures are cached; a correct password always goes through the KDF
+        with verify_cache_lock:
+            verify_cache[key] = now + VERIFY_CACHE_TTL
+            verify_cache.move_to_end(key)
+            if len(verify_cache) > VERIFY_CACHE_SIZE:
+                verify_cache.popitem(last=False)
+    return verified
+
+def _check_password(stored_hash, password):
+    """Verify against either an argon2 or a Werkzeug hash"""
+    if password_hasher is not None and stored_hash.startswith('$argon2'):
+        try:
+            return password_hasher.verify(stored_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+    return check_password_hash(stored_hash, password)
+
+# (stored hash, sha256(password)) -> expiry of a cached failure; never the raw password
+verify_cache = OrderedDict()
+verify_cache_lock = threading.Lock()
+
+# bearer token -> (student id, device id, expiry); issued at login so later requests skip the password KDF
+auth_tokens = {}
+student_tokens = defaultdict(set)  # student id -> their live tokens, so a device release can revoke them
+auth_tokens_lock = threading.Lock()  # taken last; never acquire another lock while holding it
+
+def issue_token(student_id, device_id):
+    """Mint a bearer token for a student device that just passed a password check"""
+    token = secrets.token_urlsafe(32)
+    with auth_tokens_lock:
+        auth_tokens[token] = (student_id, device_id, time.time() + TOKEN_TTL)
+        student_tokens[student_id].add(token)
+    return token
+
+def resolve_token(token):
+    """(student id, device id) for a live token, else None"""
+    entry = auth_tokens.get(token)
+    if entry is None or entry[2] <= time.time():
+        return None
+    return entry[0], entry[1]
+
+def revoke_tokens(student_id):
+    """Invalidate every token issued to a student, e.g. once their device is released"""
+    with auth_tokens_lock:
+        for token in student_tokens.pop(student_id, ()):
+            auth_tokens.pop(token, None)
+
+def expire_tokens(now):
+    """Drop every token whose lifetime has run out"""
+    with auth_tokens_lock:
+        for token in [t for t, entry in auth_tokens.items() if entry[2] <= now]:
+            student_id = auth_tokens.pop(token)[0]
+            tokens = student_tokens.get(student_id)
+            if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                    del student_tokens[student_id]
+
+def bearer_token():
+    """The request's `Authorization: Bearer` token, or None if it didn't send one"""
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    return (token.strip() or None) if scheme.lower() == 'bearer' else None
+
+def student_identity(data):
+    """(student_id, device_id) from the bearer token if one was sent, else from the request data; None for a bad token"""
+    token = bearer_token()
+    if token is None:
+        return data.get('student_id'), data.get('device_id')
+    return resolve_token(token)
+
+# (role, account id) -> (window start, failed attempts) for the per-account login throttle
+login_failures = {}
+login_failures_lock = threading.Lock()
+
+def login_blocked(account):
+    """True if the account has used up its failed-login allowance for the current minute"""
+    entry = login_failures.get(account)
+    return entry is not None and time.time() - entry[0] < 60 and entry[1] >= LOGIN_FAILURE_LIMIT
+
+def record_login_result(account, success):
+    """Reset the account's failure window on success, count the attempt on failure"""
+    with login_failures_lock:
+        if success:
+            login_failures.pop(account, None)
+            return
+        now = time.time()
+        window_start, failures = login_failures.get(account, (now, 0))
+        if now - window_start >= 60:
+            window_start, failures = now, 0
+        login_failures[account] = (window_start, failures + 1)
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that parses request bodies and encodes responses with orjson"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 app = Flask(__name__)
+if orjson is not None:
+    app.json = ORJSONProvider(app)
 CORS(app)
 
+def json_response(payload, status=200):
+    """Encode straight to bytes with orjson for large or hot payloads; jsonify otherwise"""
+    if orjson is None:
+        response = jsonify(payload)
+        response.status_code = status
+        return response
+    body = orjson.dumps(payload, default=app.json.default, option=orjson.OPT_NON_STR_KEYS)
+    return app.response_class(body, status=status, mimetype='application/json')
+
+def stream_json_list(key, items):
+    """Stream {key: [...]} from an iterable in orjson-encoded chunks; only one chunk of items is live at a time"""
+    if orjson is None:
+        return jsonify({key: list(items)}), 200
+    
+    def generate():
+        iterator = iter(items)
+        yield b'{"' + key.encode() + b'":['
+        separator = b''
+        while True:
+            batch = list(itertools.islice(iterator, STREAM_CHUNK_SIZE))
+            if not batch:
+                break
+            chunk = orjson.dumps(batch, default=app.json.default, option=orjson.OPT_NON_STR_KEYS)
+            yield separator + chunk[1:-1]
+            separator = b','
+        yield b']}'
+    return app.response_class(generate(), mimetype='application/json')
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger('AttendanceServer')
@@ -29,6 +217,110 @@ logger.addHandler(handler)
 # Configuration
 CHECKIN_TIMEOUT = 5  # seconds
 MAX_CHECKIN_RATE = 60  # max checkins per minute per student
+VERIFY_CACHE_TTL = 60  # seconds a failed password check is reused
+VERIFY_CACHE_SIZE = 1024
+STREAM_CHUNK_SIZE = 500  # records per chunk in streamed list responses
+LOGIN_FAILURE_LIMIT = 5  # failed logins per account per minute before answering 429
+# Hard cap on a bearer token's life. In practice a token ends sooner: it is revoked when its device is
+# released, which device expiry does after DEVICE_TIMEOUT idle seconds.
+TOKEN_TTL = 12 * 3600
+DEVICE_TIMEOUT = 300  # seconds without activity before a device is released
+SEED_SAMPLE_DATA = bool(os.getenv('SEED_SAMPLE_DATA'))  # seed sample students at startup (local testing)
+SNAPSHOT_FILE = os.getenv('SNAPSHOT_FILE')  # opt-in: persist accounts, sessions and timetables across restarts
+SNAPSHOT_INTERVAL = 5  # seconds changes are coalesced before one snapshot write
+# Collections written to SNAPSHOT_FILE; checkins, timers and active devices are transient
+PERSISTED_KEYS = ('teachers', 'students', 'sessions', 'manual_overrides', 'timetables',
+                  'special_dates', 'server_settings')
+
+# Shared immutable defaults; built once instead of per signup/request
+DEFAULT_BRANCHES = ("CSE", "ECE", "EEE", "ME", "CE")
+DEFAULT_SEMESTERS = tuple(range(1, 9))
+PING_OK_BODY = b'{"message":"Ping successful"}'  # pre-encoded; only the Response wrapper is per request
+STUDENT_UPDATE_FIELDS = frozenset(['name', 'classroom', 'branch', 'semester', 'locked_device_id', 'attendance'])
+STUDENT_INDEX_FIELDS = frozenset(['classroom', 'branch', 'semester'])  # updates that move index buckets
+TEACHER_UPDATE_FIELDS = frozenset(['email', 'name', 'classrooms', 'bssid_mapping', 'branches', 'semesters'])
+
+# Declared types for student fields accepted from clients; semester is always stored as an int
+
+def public_view(record):
+    """Copy of a teacher/student record without its password hash, safe to return to clients"""
+    return {k: v for k, v in record.items() if k != 'password'}
+
+def strict_str(value):
+    """Accept only an actual string; str() of a list or dict would otherwise slip into the indexes"""
+    if not isinstance(value, str):
+        raise TypeError(f"expected a string, got {type(value).__name__}")
+    return value
+
+def strict_int(value):
+    """Accept an int (not a bool) or a string of digits; floats and other types are rejected, not truncated"""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    raise ValueError(f"expected an integer, got {value!r}")
+
+STUDENT_FIELD_TYPES = {'name': strict_str, 'classroom': strict_str, 'branch': strict_str, 'semester': strict_int}
+
+def coerce_fields(values, schema):
+    """Convert fields to their declared types; raises TypeError/ValueError on bad input"""
+    return {k: schema[k](v) if k in schema else v for k, v in values.items()}
+
+def is_attendance_map(value):
+    """True if value has the {date: {session_key: {record}}} shape student attendance is stored in"""
+    return isinstance(value, dict) and all(
+        isinstance(sessions, dict) and all(isinstance(record, dict) for record in sessions.values())
+        for sessions in value.values())
+
+class ShardedDeviceStore:
+    """Active-device map split into independently locked shards keyed by student id"""
+
+    def __init__(self, shard_count=16):
+        self.shards = [({}, threading.Lock()) for _ in range(shard_count)]
+        self.on_new = None  # called with (student_id, last_activity) when an entry is created
+
+    def _shard(self, student_id):
+        return self.shards[hash(student_id) % len(self.shards)]
+
+    def get(self, student_id):
+        devices, _ = self._shard(student_id)
+        return devices.get(student_id)
+
+    def touch(self, student_id, device_id):
+        """Stamp activity now, replacing the entry when the device changed"""
+        devices, lock = self._shard(student_id)
+        now = time.time()
+        with lock:
+            device = devices.get(student_id)
+            if device is not None and device['device_id'] == device_id:
+                device['last_activity'] = now
+                return
+            devices[student_id] = {
+                'student_id': student_id,
+                'device_id': device_id,
+                'last_activity': now
+            }
+        if self.on_new:
+            self.on_new(student_id, now)
+
+    def pop(self, student_id):
+        devices, lock = self._shard(student_id)
+        with lock:
+            return devices.pop(student_id, None)
+
+    def pop_idle(self, student_id, threshold):
+        """Remove and return the entry if it has been idle since before threshold"""
+        devices, lock = self._shard(student_id)
+        with lock:
+            device = devices.get(student_id)
+            if device is None or device['last_activity'] >= threshold:
+                return None
+            return devices.pop(student_id)
+
+    def clear(self):
+        for devices, lock in self.shards:
+            with lock:
+                devices.clear()
 
 class JSONDatabase:
     def __init__(self):
@@ -38,7 +330,6 @@ class JSONDatabase:
             'sessions': {},
             'checkins': [],
             'timers': {},
-            'active_devices': {},
             'manual_overrides': {},
             'timetables': defaultdict(dict),
             'special_dates': {'holidays': [], 'special_schedules': []},
@@ -48,30 +339,99 @@ class JSONDatabase:
                 'timer_duration': 300,
                 'max_checkin_rate': MAX_CHECKIN_RATE
             },
-            'bssid_mappings': {}  # Separate storage for classroom to BSSID mappings
+            'bssid_mappings': {}  # classroom -> BSSID, rebuilt from teachers' mappings on every change
         }
+        self.latest_checkins = {}  # student_id -> {device_id: most recent checkin}
+        self.teacher_emails = {}  # email -> teacher_id, keeps signup's uniqueness check O(1)
+        self.teacher_views = {}  # teacher_id -> public_view(teacher), rebuilt whenever the teacher changes
+        # Secondary student indexes; dict values act as insertion-ordered sets of student ids
+        self.students_by_classroom = defaultdict(dict)  # classroom -> {student_id: None}
+        self.students_by_cohort = defaultdict(dict)  # (branch, semester) -> {student_id: None}
+        self.active_sessions = defaultdict(dict)  # classroom -> {session_id: session} for sessions not yet ended
+        self.session_start_ts = {}  # session_id -> epoch start of an active session; internal, never serialized
+        self.attendance_counts = {}  # student_id -> [present, total] recorded sessions, kept in step with attendance
+        self.timetable_bodies = {}  # (branch, semester) -> encoded timetable response, dropped on update
+        self.active_devices = ShardedDeviceStore()  # own shard locks, so device touches skip self.lock
+        self.on_change = None  # called after persisted data changes; set by the snapshot writer
         self.lock = threading.Lock()
+        # Guards data['checkins'] and latest_checkins, so the checkin hot path and the checkin sweep
+        # don't contend with everything else on self.lock. When both are needed: self.lock first.
+        self.checkins_lock = threading.Lock()
+        if SNAPSHOT_FILE and os.path.exists(SNAPSHOT_FILE):
+            self.load_snapshot(SNAPSHOT_FILE)
         self._initialize_data()
 
+    def _changed(self):
+        # Tell the snapshot writer (if any) that a persisted collection was modified
+        if self.on_change:
+            self.on_change()
+
+    def snapshot(self):
+        """Persisted collections as JSON bytes, encoded under the lock so the copy is consistent"""
+        with self.lock:
+            payload = {key: self.data[key] for key in PERSISTED_KEYS}
+            if orjson is not None:
+                return orjson.dumps(payload, default=app.json.default, option=orjson.OPT_NON_STR_KEYS)
+            return app.json.dumps(payload).encode()
+
+    def load_snapshot(self, path):
+        """Restore persisted collections and rebuild the derived indexes; device locks start released"""
+        with open(path, 'rb') as f:
+            saved = app.json.loads(f.read())
+        with self.lock:
+            for key in PERSISTED_KEYS:
+                if key in saved:
+                    self.data[key] = saved[key]
+            # JSON object keys are strings, but timetables are looked up by integer semester
+            self.data['timetables'] = defaultdict(dict, {
+                branch: {int(semester): timetable for semester, timetable in by_semester.items()}
+                for branch, by_semester in self.data['timetables'].items()
+            })
+            # Active devices aren't persisted, so nothing would ever expire a restored lock
+            for student in self.data['students'].values():
+                student['locked_device_id'] = None
+            self.students_by_classroom.clear()
+            self.students_by_cohort.clear()
+            self.attendance_counts.clear()
+            for student in self.data['students'].values():
+                self._index_student(student)
+                self._count_attendance(student)
+            self.active_sessions.clear()
+            for session in self.data['sessions'].values():
+                session.pop('start_ts', None)  # older snapshots stored it inline; end_session falls back to start_time
+                self._track_session(session)
+            teachers = self.data['teachers']
+            self.teacher_emails = {teacher['email']: teacher_id for teacher_id, teacher in teachers.items()}
+            self.teacher_views = {teacher_id: public_view(teacher) for teacher_id, teacher in teachers.items()}
+            self.timetable_bodies.clear()
+            self._rebuild_bssid_index()
+
     def _initialize_data(self):
-        # Create admin account if not exists
-        if 'admin' not in self.data['teachers']:
-            self.data['teachers']['admin'] = {
-                'id': 'admin',
-                'password': generate_password_hash('admin'),
-                'email': 'admin@school.com',
-                'name': 'Admin',
-                'classrooms': ["A101", "A102", "B201", "B202"],
-                'bssid_mapping': {"A101": "00:11:22:33:44:55", "A102": "AA:BB:CC:DD:EE:FF"},
-                'branches': ["CSE", "ECE", "EEE", "ME", "CE"],
-                'semesters': list(range(1, 9))
-            }
+        # Create admin account if not exists; checked first so a snapshot-restored admin skips the argon2 hash
+        if self.get_teacher('admin'):
+            return
+        self.add_teacher({
+            'id': 'admin',
+            'password': hash_password('admin'),
+            'email': 'admin@school.com',
+            'name': 'Admin',
+            'classrooms': ["A101", "A102", "B201", "B202"],
+            'bssid_mapping': {"A101": "00:11:22:33:44:55", "A102": "AA:BB:CC:DD:EE:FF"},
+            'branches': DEFAULT_BRANCHES,
+            'semesters': DEFAULT_SEMESTERS
+        })
+
+    def add_sample_data(self):
+        """Seed sample students and timetable (only when SEED_SAMPLE_DATA is set)"""
+        # Hash before taking the lock so seeding never stalls other requests
+        sample_password = hash_password('student123')
+        with self.lock:
+            if self.data['students']:
+                return
 
-        # Create sample students if none exist
-        if not self.data['students']:
             self.data['students']['s001'] = {
                 'id': 's001',
-                'password': generate_password_hash('student123'),
+                'password': sample_password,
                 'name': 'John Doe',
                 'classroom': 'A101',
                 'branch': 'CSE',
@@ -82,7 +442,7 @@ class JSONDatabase:
             }
             self.data['students']['s002'] = {
                 'id': 's002',
-                'password': generate_password_hash('student123'),
+                'password': sample_password,
                 'name': 'Jane Smith',
                 'classroom': 'A101',
                 'branch': 'CSE',
@@ -92,69 +452,145 @@ class JSONDatabase:
                 'last_checkin': None
             }
 
+            for student in self.data['students'].values():
+                self._index_student(student)
+                self._count_attendance(student)
+
             # Create sample timetable
+            self.timetable_bodies.pop(('CSE', 3), None)
             self.data['timetables']['CSE'][3] = [
                 ["Monday", "09:00", "10:00", "Mathematics", "A101"],
                 ["Monday", "10:00", "11:00", "Physics", "A101"]
             ]
+            self._changed()
 
+    # Single-key reads are atomic under the GIL and skip the lock;
+    # scans and multi-step writes below still serialize on it.
     def get_teacher(self, teacher_id):
-        with self.lock:
-            return self.data['teachers'].get(teacher_id)
+        return self.data['teachers'].get(teacher_id)
+
+    def get_teacher_view(self, teacher_id):
+        return self.teacher_views.get(teacher_id)
+
+    def get_teacher_by_email(self, email):
+        teacher_id = self.teacher_emails.get(email)
+        return self.data['teachers'].get(teacher_id) if teacher_id else None
 
     def get_student(self, student_id):
-        with self.lock:
-            return self.data['students'].get(student_id)
+        return self.data['students'].get(student_id)
 
     def get_session(self, session_id):
-        with self.lock:
-            return self.data['sessions'].get(session_id)
+        return self.data['sessions'].get(session_id)
+
+    def get_session_start_ts(self, session_id):
+        """Epoch start of an active session opened by this process, else None"""
+        return self.session_start_ts.get(session_id)
 
     def get_active_session_for_classroom(self, classroom):
         with self.lock:
-            for session in self.data['sessions'].values():
-                if session['classroom'] == classroom and not session.get('end_time'):
-                    return session
+            return self._active_session_for_classroom(classroom)
+
+    def _active_session_for_classroom(self, classroom):
+        # Caller must hold self.lock; the earliest-opened active session, as the old scan returned
+        return next(iter(self.active_sessions.get(classroom, {}).values()), None)
+
+    def _track_session(self, session):
+        # Caller must hold self.lock
+        if not session.get('end_time'):
+            self.active_sessions[session['classroom']][session['id']] = session
+
+    def _untrack_session(self, session):
+        # Caller must hold self.lock
+        bucket = self.active_sessions.get(session['classroom'])
+        if bucket is not None:
+            bucket.pop(session['id'], None)
+            if not bucket:
+                del self.active_sessions[session['classroom']]
+
+    def _last_checkin(self, student_id, device_id=None):
+        # Caller must hold self.checkins_lock
+        by_device = self.latest_checkins.get(student_id)
+        if not by_device:
             return None
-
-    def get_last_checkin(self, student_id, device_id=None):
-        with self.lock:
-            checkins = [c for c in self.data['checkins'] if c['student_id'] == student_id]
-            if device_id:
-                checkins = [c for c in checkins if c['device_id'] == device_id]
-            return max(checkins, key=lambda x: x['timestamp']) if checkins else None
+        if device_id:
+            return by_device.get(device_id)
+        return max(by_device.values(), key=lambda x: x['ts'])
+
+    def get_timer_attendance_context(self, student_id):
+        """Fetch student, timer, last checkin and settings in one lock acquisition"""
+        with self.lock, self.checkins_lock:
+            return (
+                self.data['students'].get(student_id),
+                self.data['timers'].get(student_id),
+                self._last_checkin(student_id),
+                self.data['server_settings']
+            )
 
     def get_timer(self, student_id):
-        with self.lock:
-            return self.data['timers'].get(student_id)
+        return self.data['timers'].get(student_id)
 
     def get_active_device(self, student_id):
-        with self.lock:
-            return self.data['active_devices'].get(student_id)
+        return self.active_devices.get(student_id)
 
     def get_manual_override(self, student_id):
-        with self.lock:
-            return self.data['manual_overrides'].get(student_id)
+        return self.data['manual_overrides'].get(student_id)
 
     def get_timetable(self, branch, semester):
+        return self.data['timetables'].get(branch, {}).get(semester, [])
+
+    def get_timetable_body(self, branch, semester):
+        """Encoded {'timetable': [...]} body, built once per stored timetable and reused until it changes"""
+        key = (branch, semester)
+        body = self.timetable_bodies.get(key)
+        if body is not None:
+            return body
         with self.lock:
-            return self.data['timetables'].get(branch, {}).get(semester, [])
+            body = app.json.dumps({'timetable': self.get_timetable(branch, semester)})
+            # Only timetables that exist are cached, so arbitrary query strings can't grow the cache
+            if semester in self.data['timetables'].get(branch, {}):
+                self.timetable_bodies[key] = body
+            return body
 
     def get_special_dates(self):
-        with self.lock:
-            return self.data['special_dates']
+        return self.data['special_dates']
 
     def get_server_settings(self):
-        with self.lock:
-            return self.data['server_settings']
+        return self.data['server_settings']
 
     def get_expected_bssid(self, classroom):
         with self.lock:
-            # Check all teachers' mappings for this classroom
-            for teacher in self.data['teachers'].values():
-                if 'bssid_mapping' in teacher and classroom in teacher['bssid_mapping']:
-                    return teacher['bssid_mapping'][classroom]
-            return None
+            return self._expected_bssid(classroom)
+
+    def _expected_bssid(self, classroom):
+        # Caller must hold self.lock
+        return self.data['bssid_mappings'].get(classroom)
+
+    def _rebuild_bssid_index(self):
+        # Caller must hold self.lock; the first teacher mapping a classroom wins, as the old scan did
+        index = {}
+        for teacher in self.data['teachers'].values():
+            for classroom, bssid in teacher.get('bssid_mapping', {}).items():
+                index.setdefault(classroom, bssid)
+        self.data['bssid_mappings'] = index
+
+    def get_student_status(self, student_id, device_id):
+        """Student, checkin, timer and both BSSIDs in one lock; touches the device only if it is allowed"""
+        with self.lock:
+            student = self.data['students'].get(student_id)
+            if student is None:
+                return None, None, None, None, None
+            if student['locked_device_id'] and student['locked_device_id'] != device_id:
+                return student, None, None, None, None
+            self._touch_device(student_id, device_id)
+            with self.checkins_lock:
+                checkin = self._last_checkin(student_id)
+            return (
+                student,
+                checkin,
+                self.data['timers'].get(student_id),
+                self.data['server_settings']['authorized_bssid'],
+                self._expected_bssid(student['classroom'])
+            )
 
     def get_bssid_mappings(self, teacher_id):
         with self.lock:
@@ -164,56 +600,216 @@ class JSONDatabase:
             return {}
 
     def add_teacher(self, teacher_data):
+        """Insert a teacher unless the ID or email is taken; returns True if inserted"""
         with self.lock:
+            if teacher_data['id'] in self.data['teachers'] or teacher_data['email'] in self.teacher_emails:
+                return False
             self.data['teachers'][teacher_data['id']] = teacher_data
+            self.teacher_emails[teacher_data['email']] = teacher_data['id']
+            self.teacher_views[teacher_data['id']] = public_view(teacher_data)
+            if teacher_data.get('bssid_mapping'):
+                self._rebuild_bssid_index()
+            self._changed()
+            return True
 
     def add_student(self, student_data):
+        """Insert a student unless the ID is taken; returns True if inserted"""
         with self.lock:
+            if student_data['id'] in self.data['students']:
+                return False
             self.data['students'][student_data['id']] = student_data
+            self._index_student(student_data)
+            self._count_attendance(student_data)
+            self._changed()
+            return True
 
-    def add_session(self, session_data):
+    def _index_student(self, student):
+        # Caller must hold self.lock
+        self.students_by_classroom[student['classroom']][student['id']] = None
+        self.students_by_cohort[(student['branch'], student['semester'])][student['id']] = None
+
+    def _unindex_student(self, student):
+        # Caller must hold self.lock; empty buckets are dropped so the indexes don't grow unbounded
+        for index, key in ((self.students_by_classroom, student['classroom']),
+                           (self.students_by_cohort, (student['branch'], student['semester']))):
+            bucket = index.get(key)
+            if bucket is not None:
+                bucket.pop(student['id'], None)
+                if not bucket:
+                    del index[key]
+
+    def _count_attendance(self, student):
+        # Caller must hold self.lock; full recount, for when attendance is replaced wholesale
+        self.attendance_counts[student['id']] = self._tally_attendance(student.get('attendance', {}))
+
+    def _tally_attendance(self, attendance):
+        # [present, total] for an attendance map; Counter tallies statuses in C
+        statuses = Counter(session.get('status')
+                           for sessions in attendance.values()
+                           for session in sessions.values())
+        return [statuses['present'], sum(statuses.values())]
+
+    def _students_in(self, index, key):
+        # Caller must hold self.lock
+        students = self.data['students']
+        return [students[sid] for sid in index.get(key, ())]
+
+    def open_session(self, session_data, authorized_bssid, start_ts):
+        """Insert a session unless its classroom already has an active one; returns True if inserted"""
         with self.lock:
+            if self._active_session_for_classroom(session_data['classroom']):
+                return False
             self.data['sessions'][session_data['id']] = session_data
+            self.session_start_ts[session_data['id']] = start_ts
+            self._track_session(session_data)
+            if authorized_bssid:
+                self.data['server_settings']['authorized_bssid'] = authorized_bssid
+            self._changed()
+            return True
 
-    def add_checkin(self, checkin_data):
-        with self.lock:
+    def record_checkin(self, checkin_data, min_gap=0):
+        """Store a checkin unless the device checked in under min_gap seconds ago; returns that earlier checkin if so"""
+        student_id = checkin_data['student_id']
+        device_id = checkin_data['device_id']
+        # Touch first, so a concurrent expire_device sees the device and keeps this checkin
+        self._touch_device(student_id, device_id)
+        # Duplicate check and insert share one checkins_lock hold, so two racing checkins can't both pass
+        with self.checkins_lock:
+            by_device = self.latest_checkins.setdefault(student_id, {})
+            previous = by_device.get(device_id)
+            if previous is not None and checkin_data['ts'] - previous['ts'] < min_gap:
+                return previous
             self.data['checkins'].append(checkin_data)
+            by_device[device_id] = checkin_data
+        student = self.data['students'].get(student_id)
+        if student is not None:
+            student['last_checkin'] = checkin_data['timestamp']  # single key store
 
     def add_timer(self, timer_data):
         with self.lock:
             self.data['timers'][timer_data['student_id']] = timer_data
 
-    def add_active_device(self, device_data):
-        with self.lock:
-            self.data['active_devices'][device_data['student_id']] = device_data
+    def touch_device(self, student_id, device_id):
+        """Mark a student's device active now; the store stamps the time"""
+        # Only the device's shard is locked, not the whole database
+        self._touch_device(student_id, device_id)
+
+    def _touch_device(self, student_id, device_id):
+        # Lock order is always self.lock -> shard lock, so this is safe with or without self.lock held
+        self.active_devices.touch(student_id, device_id)
 
     def add_manual_override(self, override_data):
         with self.lock:
             self.data['manual_overrides'][override_data['student_id']] = override_data
+            self._changed()
 
     def update_teacher(self, teacher_id, updates):
+        """Apply updates unless the new email belongs to another teacher; returns True if applied"""
         with self.lock:
             if teacher_id in self.data['teachers']:
-                self.data['teachers'][teacher_id].update(updates)
+                teacher = self.data['teachers'][teacher_id]
+                if 'email' in updates and updates['email'] != teacher['email']:
+                    if self.teacher_emails.get(updates['email'], teacher_id) != teacher_id:
+                        return False
+                    if self.teacher_emails.get(teacher['email']) == teacher_id:
+                        del self.teacher_emails[teacher['email']]
+                    self.teacher_emails[updates['email']] = teacher_id
+                teacher.update(updates)
+                self.teacher_views[teacher_id] = public_view(teacher)
+                if 'bssid_mapping' in updates:
+                    self._rebuild_bssid_index()
+                self._changed()
+                return True
+            return False
 
-    def update_student(self, student_id, updates):
+    def claim_device(self, student_id, device_id):
+        """Lock a student to a device and mark it active in one step; False if locked elsewhere"""
         with self.lock:
-            if student_id in self.data['students']:
-                self.data['students'][student_id].update(updates)
+            student = self.data['students'].get(student_id)
+            if student is None:
+                return False
+            if student['locked_device_id'] and student['locked_device_id'] != device_id:
+                return False
+            student['locked_device_id'] = device_id
+            self._touch_device(student_id, device_id)
+            return True
 
-    def update_session(self, session_id, updates):
+    def update_student(self, student_id, updates):
         with self.lock:
-            if session_id in self.data['sessions']:
-                self.data['sessions'][session_id].update(updates)
+            student = self.data['students'].get(student_id)
+            if student is not None:
+                # Tallied before anything changes, so a malformed attendance map leaves the record intact
+                counts = self._tally_attendance(updates['attendance']) if 'attendance' in updates else None
+                reindex = not STUDENT_INDEX_FIELDS.isdisjoint(updates)
+                if reindex:
+                    self._unindex_student(student)
+                student.update(updates)
+                if reindex:
+                    self._index_student(student)
+                if counts is not None:
+                    self.attendance_counts[student_id] = counts
+                self._changed()
 
     def update_timer(self, student_id, updates):
         with self.lock:
             if student_id in self.data['timers']:
                 self.data['timers'][student_id].update(updates)
 
+    def complete_timers(self, expired):
+        """Mark due timers completed in one pass; stale heap entries are skipped"""
+        completed = []
+        with self.lock:
+            for expiry, student_id in expired:
+                timer = self.data['timers'].get(student_id)
+                if (timer and timer['status'] == 'running'
+                        and timer['start_time'] + timer['duration'] == expiry):
+                    timer['status'] = 'completed'
+                    timer['remaining'] = 0
+                    completed.append(student_id)
+        return completed
+
+    def add_attendance_records(self, rows):
+        """Insert (student_id, date_str, session_key, record) rows under a single lock acquisition"""
+        with self.lock:
+            self._insert_attendance(rows)
+            self._changed()
+
+    def _insert_attendance(self, rows):
+        # Caller must hold self.lock
+        students = self.data['students']
+        for student_id, date_str, session_key, record in rows:
+            student = students.get(student_id)
+            if student is None:
+                continue
+            sessions = student.setdefault('attendance', {}).setdefault(date_str, {})
+            counts = self.attendance_counts.setdefault(student_id, [0, 0])
+            # Back out the record being overwritten, if any, so a re-recorded session isn't counted twice
+            previous = sessions.get(session_key)
+            if previous is not None:
+                counts[0] -= previous.get('status') == 'present'
+                counts[1] -= 1
+            sessions[session_key] = record
+            counts[0] += record.get('status') == 'present'
+            counts[1] += 1
+
+    def close_session(self, session_id, end_time, attendance_rows):
+        """End a session, record its attendance and clear the authorized BSSID in one critical section"""
+        with self.lock:
+            session = self.data['sessions'].get(session_id)
+            if not session or session.get('end_time'):
+                return False
+            session['end_time'] = end_time
+            self.session_start_ts.pop(session_id, None)
+            self._untrack_session(session)
+            self._insert_attendance(attendance_rows)
+            self.data['server_settings']['authorized_bssid'] = None
+            self._changed()
+            return True
+
     def update_server_settings(self, updates):
         with self.lock:
             self.data['server_settings'].update(updates)
+            self._changed()
 
     def update_special_dates(self, holidays, special_schedules):
         with self.lock:
@@ -221,10 +817,13 @@ class JSONDatabase:
                 'holidays': holidays,
                 'special_schedules': special_schedules
             }
+            self._changed()
 
     def update_timetable(self, branch, semester, timetable):
         with self.lock:
             self.data['timetables'][branch][semester] = timetable
+            self.timetable_bodies.pop((branch, semester), None)
+            self._changed()
 
     def set_bssid_mapping(self, teacher_id, classroom, bssid):
         with self.lock:
@@ -233,23 +832,54 @@ class JSONDatabase:
                 if 'bssid_mapping' not in teacher:
                     teacher['bssid_mapping'] = {}
                 teacher['bssid_mapping'][classroom] = bssid
+                self.teacher_views[teacher_id] = public_view(teacher)
+                self._rebuild_bssid_index()
+                self._changed()
 
     def delete_student(self, student_id):
         with self.lock:
-            self.data['students'].pop(student_id, None)
-            self.data['active_devices'].pop(student_id, None)
+            student = self.data['students'].pop(student_id, None)
+            if student is not None:
+                self._unindex_student(student)
+            self.attendance_counts.pop(student_id, None)
+            self.active_devices.pop(student_id)
             self.data['timers'].pop(student_id, None)
             self.data['manual_overrides'].pop(student_id, None)
-            self.data['checkins'] = [c for c in self.data['checkins'] if c['student_id'] != student_id]
+            with self.checkins_lock:
+                self._drop_checkins({student_id})
+            revoke_tokens(student_id)
+            self._changed()
 
     def get_students_by_classroom(self, classroom):
         with self.lock:
-            return [s for s in self.data['students'].values() if s['classroom'] == classroom]
+            return self._students_in(self.students_by_classroom, classroom)
+
+    def get_status_snapshot(self, classroom=None):
+        """(student, last checkin, timer) rows plus the authorized BSSID, in one lock acquisition"""
+        with self.lock:
+            timers = self.data['timers']
+            if classroom is None:
+                students = self.data['students'].values()
+            else:
+                students = self._students_in(self.students_by_classroom, classroom)
+            with self.checkins_lock:
+                rows = [(s, self._last_checkin(s['id']), timers.get(s['id'])) for s in students]
+            return rows, self.data['server_settings']['authorized_bssid']
+
+    def get_attendance_summary(self, classroom):
+        """Per-student present/total session counts for a classroom, read from the running tallies"""
+        with self.lock:
+            counts = self.attendance_counts
+            summary = []
+            for student in self._students_in(self.students_by_classroom, classroom):
+                present, total = counts.get(student['id'], (0, 0))
+                summary.append({'id': student['id'], 'name': student['name'],
+                                'present': present, 'total': total})
+            return summary
 
     def get_students_by_branch_semester(self, branch, semester):
         with self.lock:
-            return [s for s in self.data['students'].values() 
-                   if s['branch'] == branch and s['semester'] == semester]
+            return self._students_in(self.students_by_cohort, (branch, semester))
 
     def get_sessions_by_teacher(self, teacher_id):
         with self.lock:
@@ -257,32 +887,56 @@ class JSONDatabase:
 
     def get_active_sessions(self, teacher_id=None):
         with self.lock:
-            sessions = [s for s in self.data['sessions'].values() if not s.get('end_time')]
+            sessions = [s for bucket in self.active_sessions.values() for s in bucket.values()]
             if teacher_id:
                 sessions = [s for s in sessions if s['teacher_id'] == teacher_id]
             return sessions
 
-    def get_checkins_for_classroom(self, classroom, start_time, end_time):
+    def get_checkins_for_classroom(self, classroom, start_ts, end_ts):
+        """Checkins by the classroom's students between two epoch times"""
         with self.lock:
-            student_ids = [s['id'] for s in self.data['students'].values() if s['classroom'] == classroom]
+            student_ids = set(self.students_by_classroom.get(classroom, ()))
+        # The full checkin scan holds only the checkins lock
+        with self.checkins_lock:
             return [c for c in self.data['checkins'] 
-                   if c['student_id'] in student_ids and start_time <= c['timestamp'] <= end_time]
+                   if c['student_id'] in student_ids and start_ts <= c['ts'] <= end_ts]
 
-    def cleanup_old_checkins(self, threshold):
-        with self.lock:
-            self.data['checkins'] = [c for c in self.data['checkins'] if c['timestamp'] >= threshold]
+    def clear_checkins(self, student_id):
+        with self.checkins_lock:
+            self._drop_checkins({student_id})
+
+    def _drop_checkins(self, student_ids):
+        # Caller must hold self.checkins_lock
+        self.data['checkins'] = [c for c in self.data['checkins'] if c['student_id'] not in student_ids]
+        for student_id in student_ids:
+            self.latest_checkins.pop(student_id, None)
 
-    def cleanup_inactive_devices(self, threshold):
+    def cleanup_old_checkins(self, threshold):
+        # threshold is an epoch time; comparing the stored 'ts' floats avoids parsing any ISO strings
+        with self.checkins_lock:
+            self.data['checkins'] = [c for c in self.data['checkins'] if c['ts'] >= threshold]
+            for student_id, by_device in list(self.latest_checkins.items()):
+                for device_id, checkin in list(by_device.items()):
+                    if checkin['ts'] < threshold:
+                        del by_device[device_id]
+                if not by_device:
+                    del self.latest_checkins[student_id]
+
+    def expire_device(self, student_id, threshold):
+        """Release a student's device lock, timer and checkins if the device has been idle since threshold"""
+        if self.active_devices.pop_idle(student_id, threshold) is None:
+            return
         with self.lock:
-            inactive = [d['student_id'] for d in self.data['active_devices'].values() 
-                       if d['last_activity'] < threshold]
-            
-            for student_id in inactive:
-                self.data['active_devices'].pop(student_id, None)
-                if student_id in self.data['students']:
-                    self.data['students'][student_id]['locked_device_id'] = None
-                self.data['timers'].pop(student_id, None)
-                self.data['checkins'] = [c for c in self.data['checkins'] if c['student_id'] != student_id]
+            # A student who logged back in since the pop keeps their lock
+            if self.active_devices.get(student_id) is not None:
+                return
+            if student_id in self.data['students']:
+                self.data['students'][student_id]['locked_device_id'] = None
+            self.data['timers'].pop(student_id, None)
+            with self.checkins_lock:
+                self._drop_checkins({student_id})
+            # The released device's token must not be able to touch it back to active
+            revoke_tokens(student_id)
 
 def rate_limited(max_per_minute):
     def decorator(f):
@@ -290,7 +944,10 @@ def rate_limited(max_per_minute):
         
         @wraps(f)
         def wrapper(*args, **kwargs):
-            student_id = request.json.get('student_id')
+            # Parsed once; Flask caches the body so the view's request.json reuses it
+            body = request.get_json(silent=True) or {}
+            identity = student_identity(body)
+            student_id = identity[0] if identity else None
             now = time.time()
             
             if student_id in times:
@@ -311,134 +968,232 @@ def rate_limited(max_per_minute):
         return wrapper
     return decorator
 
+def student_device_required(f):
+    """Parse student_id/device_id once (JSON body or query string), check the device binding and stash both on g"""
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        data = request.get_json(silent=True) or request.args
+        identity = student_identity(data)
+        if identity is None:
+            return jsonify({'error': 'Invalid or expired token'}), 401
+        student_id, device_id = identity
+        
+        if not all([student_id, device_id]):
+            return jsonify({'error': 'Student ID and device ID are required'}), 400
+        
+        student = server.db.get_student(student_id)
+        if not student:
+            return jsonify({'error': 'Student not found'}), 404
+        
+        # Check device binding
+        if student['locked_device_id'] and student['locked_device_id'] != device_id:
+            return jsonify({'error': 'Unauthorized device'}), 403
+        
+        g.student_id, g.device_id, g.student = student_id, device_id, student
+        return f(*args, **kwargs)
+    
+    return wrapper
+
 class AttendanceServer:
     def __init__(self):
         self.db = JSONDatabase()
         self.running = True
+        self.timer_heap = []  # (expiry_time, student_id), lazily invalidated
+        self.timer_lock = threading.Lock()
+        # One scheduler thread runs timer completions and cleanups; it sleeps on sched_cond until the next is due
+        self.sched_cond = threading.Condition()
+        self.sched_changed = False  # an event was queued since the scheduler last computed its sleep
+        self.scheduler = sched.scheduler(time.time, self._sched_wait)
+        self.pending_expiry = set()  # student_ids with a device expiry event queued
+        self.db.active_devices.on_new = self.schedule_device_expiry
+        self.snapshot_pending = False  # a snapshot write is queued on the scheduler
+        # Serializes snapshot writes: shutdown cleanup can save while the scheduler thread is mid-write
+        self.snapshot_lock = threading.Lock()
+        if SNAPSHOT_FILE:
+            self.db.on_change = self.schedule_snapshot
         
         # Start background threads
         self.start_background_threads()
     
     def start_background_threads(self):
-        """Start all background maintenance threads"""
-        timer_thread = threading.Thread(target=self.update_timers, daemon=True)
-        timer_thread.start()
-        
-        cleanup_thread = threading.Thread(target=self.cleanup_checkins, daemon=True)
-        cleanup_thread.start()
-        
-        device_cleanup_thread = threading.Thread(target=self.cleanup_active_devices, daemon=True)
-        device_cleanup_thread.start()
+        """Start the scheduler thread that runs all background maintenance"""
+        self.schedule(time.time() + 60, self.cleanup_checkins)
+        scheduler_thread = threading.Thread(target=self.run_scheduler, daemon=True)
+        scheduler_thread.start()
         
         logger.info("Background threads started")
     
-    def update_timers(self):
-        """Background thread to update all student timers"""
-        while self.running:
-            current_time = datetime.now().timestamp()
-            
-            try:
-                timers = [t for t in self.db.data['timers'].values() if t['status'] == 'running']
-                completions = []
-                
-                for timer in timers:
-                    elapsed = current_time - timer['start_time']
-                    remaining = max(0, timer['duration'] - elapsed)
-                    
-                    if remaining <= 0:
-                        completions.append(timer['student_id'])
-                    else:
-                        self.db.update_timer(timer['student_id'], {'remaining': remaining})
-                
-                # Process completions
-                for student_id in completions:
-                    self.db.update_timer(student_id, {
-                        'status': 'completed',
-                        'remaining': 0
-                    })
-                    self.record_attendance(student_id)
-                
-            except Exception as e:
-                logger.error(f"Error in timer update thread: {e}")
+    def complete_due_timers(self):
+        """Scheduled at each timer's deadline; completes every timer due by now as one batch"""
+        try:
+            expired = []
+            with self.timer_lock:
+                # Pop every timer whose deadline has passed; later events for the same instant find none
+                current_time = time.time()
+                while self.timer_heap and self.timer_heap[0][0] <= current_time:
+                    expired.append(heapq.heappop(self.timer_heap))
             
-            time.sleep(1)
+            if expired:
+                rows = []
+                for student_id in self.db.complete_timers(expired):
+                    row = self.timer_attendance_row(student_id)
+                    if row:
+                        rows.append(row)
+                if rows:
+                    self.db.add_attendance_records(rows)
+        except Exception as e:
+            logger.error(f"Error completing timers: {e}")
+    
+    def timer_remaining(self, timer, now=None):
+        """Seconds left on a timer as of `now` (default: the current time)"""
+        if timer['status'] != 'running':
+            return timer['remaining']
+        elapsed = (now or time.time()) - timer['start_time']
+        return max(0, timer['duration'] - elapsed)
     
-    def record_attendance(self, student_id):
-        """Record attendance for completed timer"""
+    def timer_attendance_row(self, student_id):
+        """Build the attendance row for a completed timer, or None if there is nothing to record"""
         try:
-            student = self.db.get_student(student_id)
+            student, timer, checkin, settings = self.db.get_timer_attendance_context(student_id)
             if not student:
-                return
+                return None
             
-            timer = self.db.get_timer(student_id)
             if not timer or timer['status'] != 'completed':
-                return
+                return None
             
             # Check authorization
-            checkin = self.db.get_last_checkin(student_id)
-            
-            authorized_bssid = self.db.get_server_settings()['authorized_bssid']
+            authorized_bssid = settings['authorized_bssid']
             is_authorized = checkin and checkin['bssid'] == authorized_bssid
             
-            date_str = datetime.fromtimestamp(timer['start_time']).date().isoformat()
+            started = datetime.fromtimestamp(timer['start_time'])
+            date_str = started.date().isoformat()
             session_key = f"timer_{int(timer['start_time'])}"
             
-            attendance = student.get('attendance', {})
-            if date_str not in attendance:
-                attendance[date_str] = {}
-            
-            attendance[date_str][session_key] = {
+            return (student_id, date_str, session_key, {
                 'status': 'present' if is_authorized else 'absent',
                 'subject': 'Timer Session',
                 'classroom': student['classroom'],
-                'start_time': datetime.fromtimestamp(timer['start_time']).isoformat(),
-                'end_time': datetime.fromtimestamp(timer['start_time'] + 
-                    self.db.get_server_settings()['timer_duration']).isoformat(),
+                'start_time': started.isoformat(),
+                'end_time': (started + timedelta(seconds=settings['timer_duration'])).isoformat(),
                 'branch': student['branch'],
                 'semester': student['semester']
-            }
-            
-            self.db.update_student(student_id, {'attendance': attendance})
+            })
         except Exception as e:
             logger.error(f"Error recording attendance: {e}")
+            return None
     
-    def cleanup_checkins(self):
-        """Background thread to clean up old checkins"""
-        while self.running:
-            threshold = (datetime.now() - timedelta(minutes=10)).isoformat()
-            
-            try:
-                self.db.cleanup_old_checkins(threshold)
-            except Exception as e:
-                logger.error(f"Error cleaning up checkins: {e}")
-            
-            time.sleep(60)
+    def _sched_wait(self, timeout):
+        # Scheduler delay function: an interruptible sleep, so schedule() can wake it early.
+        # If an event was queued after run() picked this timeout, return so it re-reads the queue head.
+        with self.sched_cond:
+            if self.sched_changed:
+                self.sched_changed = False
+                return
+            self.sched_cond.wait(timeout)
+    
+    def schedule(self, when, action, *args):
+        """Queue action(*args) to run on the scheduler thread at epoch time `when`"""
+        with self.sched_cond:
+            self.scheduler.enterabs(when, 1, action, args)
+            self.sched_changed = True
+            self.sched_cond.notify()
     
-    def cleanup_active_devices(self):
-        """Background thread to clean up inactive devices"""
+    def run_scheduler(self):
+        """Background thread running scheduled cleanups; idle until the next event is due"""
         while self.running:
-            threshold = (datetime.now() - timedelta(minutes=5)).isoformat()
-            
             try:
-                self.db.cleanup_inactive_devices(threshold)
+                self.scheduler.run()
             except Exception as e:
-                logger.error(f"Error cleaning up devices: {e}")
-            
-            time.sleep(60)
+                logger.error(f"Error in scheduler thread: {e}")
+            with self.sched_cond:
+                while self.running and self.scheduler.empty():
+                    self.sched_cond.wait()
     
-    def start_timer(self, student_id):
-        """Start timer for a student"""
+    def stop_scheduler(self):
+        """Drop queued events and wake the scheduler thread so it exits"""
+        self.running = False
+        with self.sched_cond:
+            for event in self.scheduler.queue:
+                self.scheduler.cancel(event)
+            self.sched_cond.notify()
+    
+    def cleanup_checkins(self):
+        """Scheduled every 60s to clean up old checkins and expired bearer tokens"""
+        threshold = time.time() - 600
+        
+        try:
+            self.db.cleanup_old_checkins(threshold)
+        except Exception as e:
+            logger.error(f"Error cleaning up checkins: {e}")
+        
+        try:
+            expire_tokens(time.time())
+        except Exception as e:
+            logger.error(f"Error expiring tokens: {e}")
+        
+        if self.running:
+            self.schedule(time.time() + 60, self.cleanup_checkins)
+    
+    def schedule_snapshot(self):
+        """Queue one snapshot write SNAPSHOT_INTERVAL after the first unsaved change; later changes ride along"""
+        with self.sched_cond:
+            if self.snapshot_pending:
+                return
+            self.snapshot_pending = True
+        self.schedule(time.time() + SNAPSHOT_INTERVAL, self.save_snapshot)
+    
+    def save_snapshot(self):
+        """Write the persisted collections to SNAPSHOT_FILE via a temp file and an atomic rename"""
+        with self.sched_cond:
+            # Cleared before encoding, so a change made while writing queues another snapshot
+            self.snapshot_pending = False
+        try:
+            # Encoded inside the lock too, so the last writer to rename always has the newest data
+            with self.snapshot_lock:
+                body = self.db.snapshot()
+                tmp_path = SNAPSHOT_FILE + '.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(body)
+                os.replace(tmp_path, SNAPSHOT_FILE)
+        except Exception as e:
+            logger.error(f"Error saving snapshot: {e}")
+    
+    def schedule_device_expiry(self, student_id, last_activity):
+        """Queue one expiry check per newly active device; later touches are picked up when it fires"""
+        with self.sched_cond:
+            if student_id in self.pending_expiry:
+                return
+            self.pending_expiry.add(student_id)
+        self.schedule(last_activity + DEVICE_TIMEOUT, self.expire_device, student_id)
+    
+    def expire_device(self, student_id):
+        """Release an idle device, or re-arm the check if the device was touched since it was queued"""
+        try:
+            self.db.expire_device(student_id, time.time() - DEVICE_TIMEOUT)
+        except Exception as e:
+            logger.error(f"Error cleaning up device: {e}")
+        
+        with self.sched_cond:
+            device = self.db.get_active_device(student_id)
+            if device is None:
+                self.pending_expiry.discard(student_id)
+                return
+        self.schedule(device['last_activity'] + DEVICE_TIMEOUT, self.expire_device, student_id)
+    
+    def start_timer(self, student_id, start_time=None):
+        """Start timer for a student, from `start_time` if the caller already read the clock"""
         try:
             if not self.db.get_student(student_id):
                 return False
             
             existing_timer = self.db.get_timer(student_id)
             settings = self.db.get_server_settings()
+            start_time = start_time or time.time()
             
             if existing_timer:
                 self.db.update_timer(student_id, {
                     'status': 'running',
-                    'start_time': datetime.now().timestamp(),
+                    'start_time': start_time,
                     'duration': settings['timer_duration'],
                     'remaining': settings['timer_duration']
                 })
@@ -446,11 +1201,16 @@ class AttendanceServer:
                 self.db.add_timer({
                     'student_id': student_id,
                     'status': 'running',
-                    'start_time': datetime.now().timestamp(),
+                    'start_time': start_time,
                     'duration': settings['timer_duration'],
                     'remaining': settings['timer_duration']
                 })
             
+            expiry = start_time + settings['timer_duration']
+            with self.timer_lock:
+                heapq.heappush(self.timer_heap, (expiry, student_id))
+            self.schedule(expiry, self.complete_due_timers)
+            
             return True
         except Exception as e:
             logger.error(f"Error starting timer: {e}")
@@ -461,11 +1221,25 @@ server = AttendanceServer()
 
 # Cleanup on exit
 def cleanup():
-    server.running = False
+    if not server.running:
+        return
+    server.stop_scheduler()
+    if server.snapshot_pending:
+        server.save_snapshot()
     logger.info("Server shutting down...")
 
+# Chain to the previous SIGTERM handler (gunicorn's graceful exit) or exit; cleanup alone kept the process alive
+previous_sigterm = signal.getsignal(signal.SIGTERM)
+
+def handle_sigterm(signum, frame):
+    cleanup()
+    if callable(previous_sigterm):
+        previous_sigterm(signum, frame)
+    else:
+        raise SystemExit(0)
+
 atexit.register(cleanup)
-signal.signal(signal.SIGTERM, lambda signum, frame: cleanup())
+signal.signal(signal.SIGTERM, handle_sigterm)
 
 # Student endpoints
 @app.route('/student/checkin', methods=['POST'])
@@ -473,9 +1247,11 @@ signal.signal(signal.SIGTERM, lambda signum, frame: cleanup())
 def student_checkin():
     start_time = time.time()
     data = request.json
-    student_id = data.get('student_id')
+    identity = student_identity(data)
+    if identity is None:
+        return jsonify({'error': 'Invalid or expired token'}), 401
+    student_id, device_id = identity
     bssid = data.get('bssid')
-    device_id = data.get('device_id')
 
     if not all([student_id, device_id]):
         return jsonify({'error': 'Student ID and device ID are required'}), 400
@@ -489,42 +1265,32 @@ def student_checkin():
         if student['locked_device_id'] and student['locked_device_id'] != device_id:
             return jsonify({'error': 'Unauthorized device'}), 403
 
-        # Check if this is a duplicate check-in (same device within checkin interval)
-        last_checkin = server.db.get_last_checkin(student_id, device_id)
-        
-        if last_checkin:
-            last_time = datetime.fromisoformat(last_checkin['timestamp'])
-            if (datetime.now() - last_time).total_seconds() < server.db.get_server_settings()['checkin_interval'] * 60:
-                return jsonify({
-                    'message': 'Duplicate check-in ignored',
-                    'status': 'present' if bssid and bssid == student.get('last_bssid') else 'absent'
-                }), 200
-
-        # Record checkin
-        server.db.add_checkin({
+        # Read settings once, and reuse the clock reading taken at the top of the request
+        settings = server.db.get_server_settings()
+
+        # Record checkin, refresh the active device and the student's last check-in time,
+        # unless it duplicates this device's check-in within the checkin interval
+        last_checkin = server.db.record_checkin({
             'student_id': student_id,
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': datetime.fromtimestamp(start_time).isoformat(),
+            'ts': start_time,  # epoch copy for cleanup, dedup and session-window comparisons
             'bssid': bssid,
             'device_id': device_id
-        })
-
-        # Update active device
-        server.db.add_active_device({
-            'student_id': student_id,
-            'device_id': device_id,
-            'last_activity': datetime.now().isoformat()
-        })
-
-        # Update student's last check-in time
-        server.db.update_student(student_id, {'last_checkin': datetime.now().isoformat()})
+        }, settings['checkin_interval'] * 60)
+        
+        if last_checkin:
+            return jsonify({
+                'message': 'Duplicate check-in ignored',
+                'status': 'present' if bssid and bssid == student.get('last_bssid') else 'absent'
+            }), 200
 
         # Get authorized BSSID
-        authorized_bssid = server.db.get_server_settings()['authorized_bssid']
+        authorized_bssid = settings['authorized_bssid']
 
         # Start timer if authorized
         timer_started = False
         if bssid and bssid == authorized_bssid:
-            timer_started = server.start_timer(student_id)
+            timer_started = server.start_timer(student_id, start_time)
 
         logger.info(f"Checkin processed for {student_id} in {time.time() - start_time:.3f}s")
         return jsonify({
@@ -556,24 +1322,19 @@ def student_login():
         if not student:
             return jsonify({'error': 'Student not found'}), 404
         
-        if not check_password_hash(student['password'], password):
+        account = ('student', student_id)
+        if login_blocked(account):
+            return jsonify({'error': 'Too many failed login attempts', 'retry_after': 60}), 429
+        
+        verified = verify_password(student['password'], password)
+        record_login_result(account, verified)
+        if not verified:
             return jsonify({'error': 'Incorrect password'}), 401
         
-        # Check if student is locked to a different device
-        if student['locked_device_id'] and student['locked_device_id'] != device_id:
+        # Lock to this device (or confirm the existing lock) and mark it active atomically
+        if not server.db.claim_device(student_id, device_id):
             return jsonify({'error': 'This account is locked to another device'}), 403
         
-        # Lock student to this device if not already locked
-        if not student['locked_device_id']:
-            server.db.update_student(student_id, {'locked_device_id': device_id})
-        
-        # Update or insert active device
-        server.db.add_active_device({
-            'student_id': student_id,
-            'device_id': device_id,
-            'last_activity': datetime.now().isoformat()
-        })
-        
         # Find BSSID by checking classroom mapping
         classroom = student['classroom']
         expected_bssid = server.db.get_expected_bssid(classroom)
@@ -587,7 +1348,9 @@ def student_login():
                 'branch': student['branch'],
                 'semester': student['semester']
             },
-            'expected_bssid': expected_bssid
+            'expected_bssid': expected_bssid,
+            'token': issue_token(student_id, device_id),
+            'expires_in': TOKEN_TTL
         }), 200
     except Exception as e:
         logger.error(f"Student login error: {str(e)}")
@@ -595,14 +1358,17 @@ def student_login():
 
 @app.route('/student/get_status', methods=['GET'])
 def student_get_status():
-    student_id = request.args.get('student_id')
-    device_id = request.args.get('device_id')
+    identity = student_identity(request.args)
+    if identity is None:
+        return jsonify({'error': 'Invalid or expired token'}), 401
+    student_id, device_id = identity
     
     if not all([student_id, device_id]):
         return jsonify({'error': 'Student ID and device ID are required'}), 400
     
     try:
-        student = server.db.get_student(student_id)
+        # Device check, activity update and every lookup below happen in one store call
+        student, checkin, timer, authorized_bssid, expected_bssid = server.db.get_student_status(student_id, device_id)
         if not student:
             return jsonify({'error': 'Student not found'}), 404
         
@@ -610,25 +1376,8 @@ def student_get_status():
         if student['locked_device_id'] and student['locked_device_id'] != device_id:
             return jsonify({'error': 'Unauthorized device'}), 403
         
-        # Update last activity
-        server.db.add_active_device({
-            'student_id': student_id,
-            'device_id': device_id,
-            'last_activity': datetime.now().isoformat()
-        })
-        
-        # Get checkin
-        checkin = server.db.get_last_checkin(student_id)
-        
-        # Get timer
-        timer = server.db.get_timer(student_id)
-        
-        authorized_bssid = server.db.get_server_settings()['authorized_bssid']
         is_authorized = checkin and checkin['bssid'] == authorized_bssid
         
-        # Get expected BSSID for student's classroom
-        expected_bssid = server.db.get_expected_bssid(student['classroom'])
-        
         status = {
             'student_id': student_id,
             'name': student['name'],
@@ -638,41 +1387,31 @@ def student_get_status():
             'timestamp': checkin['timestamp'] if checkin else None,
             'timer': {
                 'status': timer['status'] if timer else 'stop',
-                'remaining': timer['remaining'] if timer else 0,
+                'remaining': server.timer_remaining(timer) if timer else 0,
                 'start_time': timer['start_time'] if timer else None
             },
             'expected_bssid': expected_bssid,
             'is_connected_to_correct_bssid': checkin and checkin['bssid'] == expected_bssid
         }
         
-        return jsonify(status), 200
+        response = json_response(status)
+        # Tag on whole seconds of the timer: a body hash would change on every poll while a timer runs,
+        # since the float remaining differs each time. Unchanged polls within a second get an empty 304.
+        status['timer']['remaining'] = int(status['timer']['remaining'])
+        response.set_etag(hashlib.blake2b(app.json.dumps(status).encode(), digest_size=8).hexdigest())
+        return response.make_conditional(request)
     except Exception as e:
         logger.error(f"Error getting student status: {str(e)}")
         return jsonify({'error': 'Failed to get status', 'details': str(e)}), 500
 
 @app.route('/student/get_attendance', methods=['GET'])
+@student_device_required
 def student_get_attendance():
-    student_id = request.args.get('student_id')
-    device_id = request.args.get('device_id')
-    
-    if not all([student_id, device_id]):
-        return jsonify({'error': 'Student ID and device ID are required'}), 400
+    student_id, device_id, student = g.student_id, g.device_id, g.student
     
     try:
-        student = server.db.get_student(student_id)
-        if not student:
-            return jsonify({'error': 'Student not found'}), 404
-        
-        # Check device binding
-        if student['locked_device_id'] and student['locked_device_id'] != device_id:
-            return jsonify({'error': 'Unauthorized device'}), 403
-        
         # Update last activity
-        server.db.add_active_device({
-            'student_id': student_id,
-            'device_id': device_id,
-            'last_activity': datetime.now().isoformat()
-        })
+        server.db.touch_device(student_id, device_id)
         
         return jsonify({
             'attendance': student.get('attendance', {})
@@ -710,7 +1449,7 @@ def get_active_session():
 def student_get_timetable():
     student_id = request.args.get('student_id')
     branch = request.args.get('branch')
-    semester = request.args.get('semester')
+    semester = request.args.get('semester', type=int)
     
     if not student_id or not branch or not semester:
         return jsonify({'error': 'Student ID, branch and semester are required'}), 400
@@ -720,69 +1459,39 @@ def student_get_timetable():
         if not student:
             return jsonify({'error': 'Student not found'}), 404
         
-        timetable = server.db.get_timetable(branch, semester)
-        
-        return jsonify({
-            'timetable': timetable
-        }), 200
+        body = server.db.get_timetable_body(branch, semester)
+        return app.response_class(body, mimetype='application/json')
     except Exception as e:
         logger.error(f"Error getting timetable: {str(e)}")
         return jsonify({'error': 'Failed to get timetable', 'details': str(e)}), 500
 
 @app.route('/student/ping', methods=['POST'])
+@student_device_required
 def student_ping():
-    data = request.json
-    student_id = data.get('student_id')
-    device_id = data.get('device_id')
-    
-    if not all([student_id, device_id]):
-        return jsonify({'error': 'Student ID and device ID are required'}), 400
+    student_id, device_id = g.student_id, g.device_id
     
     try:
-        student = server.db.get_student(student_id)
-        if not student:
-            return jsonify({'error': 'Student not found'}), 404
+        server.db.touch_device(student_id, device_id)
         
-        # Check device binding
-        if student['locked_device_id'] and student['locked_device_id'] != device_id:
-            return jsonify({'error': 'Unauthorized device'}), 403
-        
-        server.db.add_active_device({
-            'student_id': student_id,
-            'device_id': device_id,
-            'last_activity': datetime.now().isoformat()
-        })
-        
-        return jsonify({'message': 'Ping successful'}), 200
+        return app.response_class(PING_OK_BODY, mimetype='application/json')
     except Exception as e:
         logger.error(f"Error processing ping: {str(e)}")
         return jsonify({'error': 'Ping failed', 'details': str(e)}), 500
 
 @app.route('/student/cleanup_dead_sessions', methods=['POST'])
+@student_device_required
 def cleanup_dead_sessions():
-    data = request.json
-    student_id = data.get('student_id')
-    device_id = data.get('device_id')
-    
-    if not all([student_id, device_id]):
-        return jsonify({'error': 'Student ID and device ID are required'}), 400
+    student_id, device_id = g.student_id, g.device_id
     
     try:
-        student = server.db.get_student(student_id)
-        if not student:
-            return jsonify({'error': 'Student not found'}), 404
-        
-        # Check device binding
-        if student['locked_device_id'] and student['locked_device_id'] != device_id:
-            return jsonify({'error': 'Unauthorized device'}), 403
-        
         # Only cleanup if the device matches
         device = server.db.get_active_device(student_id)
         if device and device['device_id'] == device_id:
             server.db.update_student(student_id, {'locked_device_id': None})
-            server.db.data['active_devices'].pop(student_id, None)
+            server.db.active_devices.pop(student_id)
+            revoke_tokens(student_id)
         
-        server.db.data['checkins'] = [c for c in server.db.data['checkins'] if c['student_id'] != student_id]
+        server.db.clear_checkins(student_id)
         server.db.data['timers'].pop(student_id, None)
     
         return jsonify({'message': 'Session cleanup completed'}), 200
@@ -791,28 +1500,13 @@ def cleanup_dead_sessions():
         return jsonify({'error': 'Cleanup failed', 'details': str(e)}), 500
 
 @app.route('/student/get_expected_bssid', methods=['GET'])
+@student_device_required
 def get_expected_bssid():
-    student_id = request.args.get('student_id')
-    device_id = request.args.get('device_id')
-    
-    if not all([student_id, device_id]):
-        return jsonify({'error': 'Student ID and device ID are required'}), 400
+    student_id, device_id, student = g.student_id, g.device_id, g.student
     
     try:
-        student = server.db.get_student(student_id)
-        if not student:
-            return jsonify({'error': 'Student not found'}), 404
-        
-        # Check device binding
-        if student['locked_device_id'] and student['locked_device_id'] != device_id:
-            return jsonify({'error': 'Unauthorized device'}), 403
-        
         # Update last activity
-        server.db.add_active_device({
-            'student_id': student_id,
-            'device_id': device_id,
-            'last_activity': datetime.now().isoformat()
-        })
+        server.db.touch_device(student_id, device_id)
         
         # Get expected BSSID for student's classroom
         classroom = student['classroom']
@@ -839,22 +1533,21 @@ def teacher_signup():
         return jsonify({'error': 'All fields are required'}), 400
     
     try:
-        if server.db.get_teacher(teacher_id):
-            return jsonify({'error': 'Teacher ID already exists'}), 400
-        
-        if any(t['email'] == email for t in server.db.data['teachers'].values()):
+        if server.db.get_teacher_by_email(email):
             return jsonify({'error': 'Email already registered'}), 400
         
-        server.db.add_teacher({
+        added = server.db.add_teacher({
             'id': teacher_id,
-            'password': generate_password_hash(password),
+            'password': hash_password(password),
             'email': email,
             'name': name,
             'classrooms': [],
             'bssid_mapping': {},
-            'branches': ["CSE", "ECE", "EEE", "ME", "CE"],
-            'semesters': list(range(1, 9))
+            'branches': DEFAULT_BRANCHES,
+            'semesters': DEFAULT_SEMESTERS
         })
+        if not added:
+            return jsonify({'error': 'Teacher ID already exists'}), 400
         
         return jsonify({'message': 'Registration successful'}), 201
     except Exception as e:
@@ -875,12 +1568,18 @@ def teacher_login():
         if not teacher:
             return jsonify({'error': 'Teacher not found'}), 404
         
-        if not check_password_hash(teacher['password'], password):
+        account = ('teacher', teacher_id)
+        if login_blocked(account):
+            return jsonify({'error': 'Too many failed login attempts', 'retry_after': 60}), 429
+        
+        verified = verify_password(teacher['password'], password)
+        record_login_result(account, verified)
+        if not verified:
             return jsonify({'error': 'Incorrect password'}), 401
         
         return jsonify({
             'message': 'Login successful',
-            'teacher': teacher
+            'teacher': server.db.get_teacher_view(teacher_id)
         }), 200
     except Exception as e:
         logger.error(f"Teacher login error: {str(e)}")
@@ -900,20 +1599,22 @@ def register_student():
         return jsonify({'error': 'All fields are required'}), 400
     
     try:
-        if server.db.get_student(student_id):
-            return jsonify({'error': 'Student ID already exists'}), 400
-        
-        server.db.add_student({
+        fields = coerce_fields({'name': name, 'classroom': classroom, 'branch': branch, 'semester': semester},
+                               STUDENT_FIELD_TYPES)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid field value'}), 400
+    
+    try:
+        added = server.db.add_student({
             'id': student_id,
-            'password': generate_password_hash(password),
-            'name': name,
-            'classroom': classroom,
-            'branch': branch,
-            'semester': semester,
+            'password': hash_password(password),
+            **fields,
             'attendance': {},
             'locked_device_id': None,
             'last_checkin': None
         })
+        if not added:
+            return jsonify({'error': 'Student ID already exists'}), 400
         
         return jsonify({'message': 'Student registered successfully'}), 201
     except Exception as e:
@@ -926,6 +1627,12 @@ def get_students():
     branch = request.args.get('branch')
     semester = request.args.get('semester')
     
+    if semester is not None:
+        try:
+            semester = int(semester)
+        except ValueError:
+            return jsonify({'error': 'Invalid field value'}), 400
+    
     try:
         students = []
         if classroom:
@@ -935,7 +1642,8 @@ def get_students():
         else:
             students = list(server.db.data['students'].values())
         
-        return jsonify({'students': students}), 200
+        # A generator, so each password-stripped copy is made only as its chunk is encoded
+        return stream_json_list('students', (public_view(s) for s in students))
     except Exception as e:
         logger.error(f"Error getting students: {str(e)}")
         return jsonify({'error': 'Failed to get students', 'details': str(e)}), 500
@@ -953,12 +1661,19 @@ def update_student():
         if not server.db.get_student(student_id):
             return jsonify({'error': 'Student not found'}), 404
         
-        valid_fields = ['name', 'classroom', 'branch', 'semester', 'locked_device_id', 'attendance']
-        updates = {k: v for k, v in new_data.items() if k in valid_fields}
+        updates = {k: v for k, v in new_data.items() if k in STUDENT_UPDATE_FIELDS}
         
         if not updates:
             return jsonify({'error': 'No valid fields to update'}), 400
         
+        try:
+            updates = coerce_fields(updates, STUDENT_FIELD_TYPES)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid field value'}), 400
+        
+        if 'attendance' in updates and not is_attendance_map(updates['attendance']):
+            return jsonify({'error': 'Invalid field value'}), 400
+        
         server.db.update_student(student_id, updates)
         
         return jsonify({'message': 'Student updated successfully'}), 200
@@ -998,13 +1713,13 @@ def update_teacher_profile():
         if not server.db.get_teacher(teacher_id):
             return jsonify({'error': 'Teacher not found'}), 404
         
-        valid_fields = ['email', 'name', 'classrooms', 'bssid_mapping', 'branches', 'semesters']
-        updates = {k: v for k, v in new_data.items() if k in valid_fields}
+        updates = {k: v for k, v in new_data.items() if k in TEACHER_UPDATE_FIELDS}
         
         if not updates:
             return jsonify({'error': 'No valid fields to update'}), 400
         
-        server.db.update_teacher(teacher_id, updates)
+        if not server.db.update_teacher(teacher_id, updates):
+            return jsonify({'error': 'Email already registered'}), 400
         
         return jsonify({'message': 'Profile updated successfully'}), 200
     except Exception as e:
@@ -1026,10 +1741,10 @@ def change_teacher_password():
         if not teacher:
             return jsonify({'error': 'Teacher not found'}), 404
         
-        if not check_password_hash(teacher['password'], old_password):
+        if not verify_password(teacher['password'], old_password):
             return jsonify({'error': 'Incorrect current password'}), 401
         
-        server.db.update_teacher(teacher_id, {'password': generate_password_hash(new_password)})
+        server.db.update_teacher(teacher_id, {'password': hash_password(new_password)})
         
         return jsonify({'message': 'Password changed successfully'}), 200
     except Exception as e:
@@ -1099,18 +1814,20 @@ def start_session():
         return jsonify({'error': 'Teacher ID, classroom and subject are required'}), 400
     
     try:
-        if not server.db.get_teacher(teacher_id):
+        teacher = server.db.get_teacher(teacher_id)
+        if not teacher:
             return jsonify({'error': 'Teacher not found'}), 404
         
-        # Check for existing active session in this classroom
-        active_session = server.db.get_active_session_for_classroom(classroom)
-        if active_session:
-            return jsonify({'error': 'There is already an active session for this classroom'}), 400
+        # Clients end the session by this ID, so it stays unguessable; token_hex skips building a UUID
+        session_id = secrets.token_hex(16)
+        start_ts = time.time()
+        start_time = datetime.fromtimestamp(start_ts).isoformat()
         
-        session_id = str(uuid.uuid4())
-        start_time = datetime.now().isoformat()
+        # Authorized BSSID from teacher's mapping (a single key lookup on the teacher fetched above)
+        authorized_bssid = teacher.get('bssid_mapping', {}).get(classroom)
         
-        server.db.add_session({
+        # The active-session check, the insert and the BSSID switch happen atomically
+        opened = server.db.open_session({
             'id': session_id,
             'teacher_id': teacher_id,
             'classroom': classroom,
@@ -1120,14 +1837,9 @@ def start_session():
             'start_time': start_time,
             'end_time': None,
             'ad_hoc': bool(data.get('ad_hoc', False))
-        })
-        
-        # Set authorized BSSID from teacher's mapping
-        teacher = server.db.get_teacher(teacher_id)
-        authorized_bssid = teacher.get('bssid_mapping', {}).get(classroom)
-        
-        if authorized_bssid:
-            server.db.update_server_settings({'authorized_bssid': authorized_bssid})
+        }, authorized_bssid, start_ts)
+        if not opened:
+            return jsonify({'error': 'There is already an active session for this classroom'}), 400
         
         # Get expected BSSID for this classroom
         expected_bssid = server.db.get_expected_bssid(classroom)
@@ -1155,48 +1867,43 @@ def end_session():
         if not session or session.get('end_time'):
             return jsonify({'error': 'Session not found or already ended'}), 404
         
-        end_time = datetime.now().isoformat()
-        
-        # Update session
-        server.db.update_session(session_id, {'end_time': end_time})
+        end_ts = time.time()
+        end_time = datetime.fromtimestamp(end_ts).isoformat()
         
         # Record attendance for checked-in students
         classroom = session['classroom']
         session_start = datetime.fromisoformat(session['start_time'])
-        session_end = datetime.now()
+        start_ts = server.db.get_session_start_ts(session_id) or session_start.timestamp()
         
-        checkins = server.db.get_checkins_for_classroom(classroom, session['start_time'], end_time)
+        checkins = server.db.get_checkins_for_classroom(classroom, start_ts, end_ts)
+        authorized_bssid = server.db.get_server_settings()['authorized_bssid']
         
+        # Everything but the status is the same for every row, so it is computed once
+        date_str = session_start.date().isoformat()
+        session_key = f"{session['subject']}_{session_id}"
+        base_record = {
+            'subject': session['subject'],
+            'classroom': classroom,
+            'start_time': session['start_time'],
+            'end_time': end_time,
+            'branch': session['branch'],
+            'semester': session['semester']
+        }
+        
+        rows = []
         for checkin in checkins:
             student_id = checkin['student_id']
-            student = server.db.get_student(student_id)
-            if not student:
+            if not server.db.get_student(student_id):
                 continue
             
-            authorized_bssid = server.db.get_server_settings()['authorized_bssid']
             is_authorized = checkin['bssid'] == authorized_bssid
             
-            date_str = session_start.date().isoformat()
-            session_key = f"{session['subject']}_{session_id}"
-            
-            attendance = student.get('attendance', {})
-            if date_str not in attendance:
-                attendance[date_str] = {}
-            
-            attendance[date_str][session_key] = {
-                'status': 'present' if is_authorized else 'absent',
-                'subject': session['subject'],
-                'classroom': classroom,
-                'start_time': session['start_time'],
-                'end_time': end_time,
-                'branch': session['branch'],
-                'semester': session['semester']
-            }
-            
-            server.db.update_student(student_id, {'attendance': attendance})
+            rows.append((student_id, date_str, session_key,
+                         dict(base_record, status='present' if is_authorized else 'absent')))
         
-        # Clear authorized BSSID
-        server.db.update_server_settings({'authorized_bssid': None})
+        # Close the session, store attendance and clear the authorized BSSID together
+        if not server.db.close_session(session_id, end_time, rows):
+            return jsonify({'error': 'Session not found or already ended'}), 404
         
         return jsonify({'message': 'Session ended successfully'}), 200
     except Exception as e:
@@ -1217,7 +1924,7 @@ def get_sessions():
         else:
             sessions = list(server.db.data['sessions'].values())
         
-        return jsonify({'sessions': sessions}), 200
+        return json_response({'sessions': sessions})
     except Exception as e:
         logger.error(f"Error getting sessions: {str(e)}")
         return jsonify({'error': 'Failed to get sessions', 'details': str(e)}), 500
@@ -1254,23 +1961,17 @@ def get_status():
     classroom = request.args.get('classroom')
     
     try:
+        rows, authorized_bssid = server.db.get_status_snapshot(classroom or None)
         status = {
-            'authorized_bssid': server.db.get_server_settings()['authorized_bssid'],
+            'authorized_bssid': authorized_bssid,
             'students': {}
         }
         
-        students = server.db.get_students_by_classroom(classroom) if classroom else server.db.data['students'].values()
-        
-        for student in students:
+        # One clock read so every timer in the snapshot is measured at the same instant
+        now = time.time()
+        for student, checkin, timer in rows:
             student_id = student['id']
             
-            # Get checkin
-            checkin = server.db.get_last_checkin(student_id)
-            
-            # Get timer
-            timer = server.db.get_timer(student_id)
-            
-            authorized_bssid = status['authorized_bssid']
             is_authorized = checkin and checkin['bssid'] == authorized_bssid
             
             status['students'][student_id] = {
@@ -1283,12 +1984,12 @@ def get_status():
                 'timestamp': checkin['timestamp'] if checkin else None,
                 'timer': {
                     'status': timer['status'] if timer else 'stop',
-                    'remaining': timer['remaining'] if timer else 0,
+                    'remaining': server.timer_remaining(timer, now) if timer else 0,
                     'start_time': timer['start_time'] if timer else None
                 }
             }
         
-        return jsonify(status), 200
+        return json_response(status)
     except Exception as e:
         logger.error(f"Error getting status: {str(e)}")
         return jsonify({'error': 'Failed to get status', 'details': str(e)}), 500
@@ -1330,34 +2031,24 @@ def random_ring():
         return jsonify({'error': 'Classroom is required'}), 400
     
     try:
-        # Get all students in classroom with attendance data
-        students = server.db.get_students_by_classroom(classroom)
+        # Present/total counts per student, aggregated by the store in one pass
+        summary = server.db.get_attendance_summary(classroom)
         
-        if len(students) < 2:
+        if len(summary) < 2:
             return jsonify({'error': 'Need at least 2 students for random ring'}), 400
         
         # Calculate attendance percentages
-        student_stats = []
-        for student in students:
-            attendance = student.get('attendance', {})
-            total_sessions = sum(len(sessions) for sessions in attendance.values())
-            present_sessions = sum(1 for sessions in attendance.values() 
-                                 for session in sessions.values() if session.get('status') == 'present')
-            percentage = round((present_sessions / total_sessions) * 100) if total_sessions > 0 else 0
-            
-            student_stats.append({
-                'id': student['id'],
-                'name': student['name'],
-                'attendance_percentage': percentage
-            })
-        
-        # Sort by attendance percentage
-        student_stats.sort(key=lambda x: x['attendance_percentage'])
+        student_stats = [{
+            'id': s['id'],
+            'name': s['name'],
+            'attendance_percentage': round((s['present'] / s['total']) * 100) if s['total'] > 0 else 0
+        } for s in summary]
         
-        # Select one from bottom 30% and one from top 30%
+        # Select one from bottom 30% and one from top 30%; partial selection, no full sort
         split_point = max(1, len(student_stats) // 3)
-        low_attendance = student_stats[:split_point]
-        high_attendance = student_stats[-split_point:]
+        by_percentage = lambda x: x['attendance_percentage']
+        low_attendance = heapq.nsmallest(split_point, student_stats, key=by_percentage)
+        high_attendance = heapq.nlargest(split_point, student_stats, key=by_percentage)
         
         selected_low = random.choice(low_attendance)
         selected_high = random.choice(high_attendance)
@@ -1396,14 +2087,14 @@ def update_special_dates():
 @app.route('/teacher/get_timetable', methods=['GET'])
 def get_timetable():
     branch = request.args.get('branch')
-    semester = request.args.get('semester')
+    semester = request.args.get('semester', type=int)
     
     if not branch or not semester:
         return jsonify({'error': 'Branch and semester are required'}), 400
     
     try:
-        timetable = server.db.get_timetable(branch, semester)
-        return jsonify({'timetable': timetable}), 200
+        body = server.db.get_timetable_body(branch, semester)
+        return app.response_class(body, mimetype='application/json')
     except Exception as e:
         logger.error(f"Error getting timetable: {str(e)}")
         return jsonify({'error': 'Failed to get timetable', 'details': str(e)}), 500
@@ -1418,6 +2109,11 @@ def update_timetable():
     if not branch or not semester:
         return jsonify({'error': 'Branch and semester are required'}), 400
     
+    try:
+        semester = int(semester)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid field value'}), 400
+    
     try:
         server.db.update_timetable(branch, semester, timetable)
         return jsonify({'message': 'Timetable updated successfully'}), 200
@@ -1425,6 +2121,15 @@ def update_timetable():
         logger.error(f"Error updating timetable: {str(e)}")
         return jsonify({'error': 'Failed to update timetable', 'details': str(e)}), 500
 
+# Sample students and timetable for local testing; production starts with only the admin account
+if SEED_SAMPLE_DATA:
+    server.db.add_sample_data()
+    logger.warning("Seeded sample data")
+
 if __name__ == '__main__':
     logger.info("Starting server on port 5000")
-    app.run(host='0.0.0.0', port=5000)
+    if USE_GEVENT:
+        from gevent.pywsgi import WSGIServer
+        WSGIServer(('0.0.0.0', 5000), app).serve_forever()
+    else:
+        app.run(host='0.0.0.0', port=5000, threaded=True)
@@ -1,11 +1,36 @@
+import os
+
+# Opt-in cooperative I/O (USE_GEVENT=1); must patch before threading is imported
+USE_GEVENT = bool(os.getenv('USE_GEVENT'))
+if USE_GEVENT:
+    from gevent import monkey
+    monkey.patch_all()
+
 from flask import Flask, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import threading
 import time
 import random
 from datetime import datetime
 
+try:
+    import orjson
+except ImportError:  # fall back to Flask's stdlib json provider
+    orjson = None
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that parses request bodies and encodes responses with orjson"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
+if orjson is not None:
+    app.json = ORJSONProvider(app)
 CORS(app)
 
 # =========================
@@ -14,41 +39,85 @@ CORS(app)
 db = {
     "students": {},  # student_id: {details}
     "teachers": {},  # teacher_id: {details}
-    "authorized_bssids": [],
+    "authorized_bssids": {},  # dict keys: O(1) membership in the order entered; replaced wholesale, never mutated
     "current_session": None,
     "session_log": []
 }
 
-lock = threading.Lock()
+# Sub-collections that are never rebound, aliased to skip a db[...] lookup per access.
+# authorized_bssids and current_session are reassigned, so they stay behind db[...].
+STUDENTS = db["students"]
+SESSION_LOG = db["session_log"]
+
+# Separate locks so timer traffic and session bookkeeping don't serialize each other.
+# Nesting order is session_lock -> students_lock. authorized_bssids needs no lock:
+# set_bssid rebinds a fresh dict, and readers only ever see one whole dict.
+students_lock = threading.Lock()  # STUDENTS entries and their timers
+session_lock = threading.Lock()  # current_session and SESSION_LOG
 
 # =========================
 # UTILITIES
 # =========================
-def current_time_str():
-    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+# (epoch second, formatted string); the text only changes once a second, so strftime runs at most that often
+_last_time_str = (None, "")
+
+def current_time_str(now=None):
+    # Pass an epoch `now` to reuse a clock reading the handler already took
+    global _last_time_str
+    second = int(time.time() if now is None else now)
+    cached_second, text = _last_time_str
+    if cached_second != second:
+        text = datetime.fromtimestamp(second).strftime("%Y-%m-%d %H:%M:%S")
+        _last_time_str = (second, text)
+    return text
+
+def new_timer(status, remaining=0, running=False, last_update=None):
+    return {
+        "duration": 120,
+        "remaining": remaining,
+        "running": running,
+        "last_update": last_update,
+        "status": status
+    }
+
+# Timer state for each status a client may report, looked up instead of an if/elif chain
+TIMER_BUILDERS = {
+    "running": lambda remaining, now: new_timer("running", remaining, True, now),
+    "stopped": lambda remaining, now: new_timer("stopped"),
+    "completed": lambda remaining, now: new_timer("completed"),
+}
+
+def mark_session_present(student_id):
+    with session_lock:
+        if db["current_session"]:
+            db["current_session"]["students_present"].append(student_id)
+
+def session_snapshot():
+    # Copied under session_lock so serializing it can't race an append or end_session
+    with session_lock:
+        session = db["current_session"]
+        if session is None:
+            return None
+        return dict(session, students_present=list(session["students_present"]))
 
 # =========================
-# BACKGROUND TIMER THREAD
+# TIMERS (brought up to date on read, no background thread)
 # =========================
-def update_timers():
-    while True:
-        with lock:
-            for student_id, student in db["students"].items():
-                timer = student.get("timer", {})
-                if timer.get("running"):
-                    now = time.time()
-                    elapsed = now - timer["last_update"]
-                    timer["remaining"] -= elapsed
-                    timer["last_update"] = now
-                    if timer["remaining"] <= 0:
-                        timer.update({
-                            "remaining": 0,
-                            "running": False,
-                            "status": "completed"
-                        })
-        time.sleep(1)
-
-threading.Thread(target=update_timers, daemon=True).start()
+def refresh_timers():
+    # Caller must hold students_lock
+    now = time.time()  # one clock read per sweep, not per student
+    for student in STUDENTS.values():
+        timer = student.get("timer")
+        if timer and timer["running"]:
+            elapsed = now - timer["last_update"]
+            timer["remaining"] -= elapsed
+            timer["last_update"] = now
+            if timer["remaining"] <= 0:
+                timer.update({
+                    "remaining": 0,
+                    "running": False,
+                    "status": "completed"
+                })
 
 # =========================
 # TEACHER ACTIONS
@@ -56,37 +125,33 @@ threading.Thread(target=update_timers, daemon=True).start()
 @app.route('/set_bssid', methods=['POST'])
 def set_bssid():
     bssids = request.json.get("bssids", [])
-    with lock:
-        db["authorized_bssids"] = bssids
+    if not isinstance(bssids, list) or not all(isinstance(b, str) for b in bssids):
+        return jsonify({"error": "bssids must be a list of strings"}), 400
+    db["authorized_bssids"] = dict.fromkeys(bssids)
     return jsonify({"message": "BSSIDs updated", "bssids": bssids})
 
 @app.route('/start_session', methods=['POST'])
 def start_session():
     session_name = request.json.get("session_name")
-    with lock:
+    with session_lock:
         db["current_session"] = {
             "name": session_name,
             "start_time": current_time_str(),
             "students_present": []
         }
         # Reset all student timers at session start
-        for student in db["students"].values():
-            student["timer"] = {
-                "duration": 120,
-                "remaining": 0,
-                "running": False,
-                "last_update": None,
-                "status": "stopped"
-            }
+        with students_lock:
+            for student in STUDENTS.values():
+                student["timer"] = new_timer("stopped")
     return jsonify({"message": f"Session '{session_name}' started"})
 
 @app.route('/end_session', methods=['POST'])
 def end_session():
-    with lock:
+    with session_lock:
         session = db["current_session"]
         if session:
             session["end_time"] = current_time_str()
-            db["session_log"].append(session)
+            SESSION_LOG.append(session)
             db["current_session"] = None
             return jsonify({"message": "Session ended"})
         else:
@@ -94,10 +159,16 @@ def end_session():
 
 @app.route('/random_ring', methods=['POST'])
 def random_ring():
-    with lock:
-        students = list(db["students"].items())
-        attended = [sid for sid, s in students if s.get("timer", {}).get("status") == "completed"]
-        absent = [sid for sid, s in students if s.get("timer", {}).get("status") == "stopped"]
+    with students_lock:
+        refresh_timers()
+        # One pass, bucketed by timer status, instead of copying and filtering twice
+        by_status = {"completed": [], "stopped": []}
+        for sid, s in STUDENTS.items():
+            bucket = by_status.get(s.get("timer", {}).get("status"))
+            if bucket is not None:
+                bucket.append(sid)
+        attended = by_status["completed"]
+        absent = by_status["stopped"]
         selection = []
         if attended:
             selection.append(random.choice(attended))
@@ -115,100 +186,70 @@ def student_connect():
 
     if not student_id or not bssid:
         return jsonify({"error": "student_id and bssid required"}), 400
+    if not isinstance(bssid, str):
+        return jsonify({"error": "bssid must be a string"}), 400
 
-    with lock:
-        student = db["students"].setdefault(student_id, {
+    is_authorized = bssid in db["authorized_bssids"]
+    with students_lock:
+        student = STUDENTS.setdefault(student_id, {
             "name": f"Student {student_id}",
-            "timer": {
-                "duration": 120,
-                "remaining": 0,
-                "running": False,
-                "last_update": None,
-                "status": "stopped"
-            },
+            "timer": new_timer("stopped"),
             "connected": False,
             "authorized": False,
             "last_update": None
         })
-
-        is_authorized = bssid in db["authorized_bssids"]
         student["connected"] = True
         student["authorized"] = is_authorized
         student["last_update"] = current_time_str()
 
-        return jsonify({
-            "authorized": is_authorized,
-            "current_session": db["current_session"] is not None
-        })
+    return jsonify({
+        "authorized": is_authorized,
+        "current_session": db["current_session"] is not None
+    })
 
 @app.route('/student/timer/update', methods=['POST'])
 def update_timer():
     student_id = request.json.get("student_id")
     timer_status = request.json.get("status")  # "running", "stopped", "completed"
     remaining = request.json.get("remaining", 120)
+    now = time.time()  # one clock read for the timer and last_update
     
-    with lock:
-        student = db["students"].get(student_id)
+    with students_lock:
+        student = STUDENTS.get(student_id)
         if not student:
             return jsonify({"error": "Student not found"}), 404
             
-        if timer_status == "running":
-            student["timer"] = {
-                "duration": 120,
-                "remaining": remaining,
-                "running": True,
-                "last_update": time.time(),
-                "status": "running"
-            }
-        elif timer_status == "stopped":
-            student["timer"] = {
-                "duration": 120,
-                "remaining": 0,
-                "running": False,
-                "last_update": None,
-                "status": "stopped"
-            }
-        elif timer_status == "completed":
-            student["timer"] = {
-                "duration": 120,
-                "remaining": 0,
-                "running": False,
-                "last_update": None,
-                "status": "completed"
-            }
-            if db["current_session"]:
-                db["current_session"]["students_present"].append(student_id)
-        
-        student["last_update"] = current_time_str()
+        build_timer = TIMER_BUILDERS.get(timer_status)
+        if build_timer:
+            student["timer"] = build_timer(remaining, now)
+        student["last_update"] = current_time_str(now)
+    
+    if timer_status == "completed":
+        mark_session_present(student_id)
         
     return jsonify({"message": "Timer updated"})
 
 @app.route('/mark_present', methods=['POST'])
 def mark_present():
     student_id = request.json.get("student_id")
-    with lock:
-        student = db["students"].get(student_id)
-        if student:
-            student["timer"] = {
-                "duration": 120,
-                "remaining": 0,
-                "running": False,
-                "last_update": None,
-                "status": "completed"
-            }
-            if db["current_session"]:
-                db["current_session"]["students_present"].append(student_id)
-            return jsonify({"message": "Marked present"})
-        return jsonify({"error": "Student not found"}), 404
+    with students_lock:
+        student = STUDENTS.get(student_id)
+        if not student:
+            return jsonify({"error": "Student not found"}), 404
+        student["timer"] = new_timer("completed")
+    mark_session_present(student_id)
+    return jsonify({"message": "Marked present"})
 
 # =========================
 # STATUS FOR FRONTEND
 # =========================
 @app.route('/get_status', methods=['GET'])
 def get_status():
-    with lock:
+    current_session = session_snapshot()
+    with students_lock:
+        refresh_timers()
         students_status = {}
-        for sid, student in db["students"].items():
+        for sid, student in STUDENTS.items():
             timer = student.get("timer", {})
             students_status[sid] = {
                 "name": student["name"],
@@ -219,26 +260,29 @@ def get_status():
             }
 
         return jsonify({
-            "authorized_bssids": db["authorized_bssids"],
+            "authorized_bssids": list(db["authorized_bssids"]),
             "students": students_status,
-            "current_session": db["current_session"]
+            "current_session": current_session
         })
 
 @app.route('/session/status', methods=['GET'])
 def session_status():
-    with lock:
-        return jsonify({
-            "session_active": db["current_session"] is not None,
-            "session_name": db["current_session"]["name"] if db["current_session"] else None
-        })
+    session = db["current_session"]  # read the reference once; end_session may clear it
+    return jsonify({
+        "session_active": session is not None,
+        "session_name": session["name"] if session else None
+    })
 
 @app.route('/settings/bssid', methods=['GET'])
 def get_bssids():
-    with lock:
-        return jsonify({"bssids": db["authorized_bssids"]})
+    return jsonify({"bssids": list(db["authorized_bssids"])})
 
 # =========================
 # START APP
 # =========================
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000)
+    if USE_GEVENT:
+        from gevent.pywsgi import WSGIServer
+        WSGIServer(('0.0.0.0', 5000), app).serve_forever()
+    else:
+        app.run(host='0.0.0.0', port=5000, threaded=True)